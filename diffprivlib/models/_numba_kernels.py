@@ -0,0 +1,95 @@
+# MIT License
+#
+# Copyright (C) IBM Corporation 2019
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit
+# persons to whom the Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Numba kernels for the NaN-aware moments of :class:`diffprivlib.models.StandardScaler`.
+
+This module imports Numba, and is therefore only imported by `standard_scaler._jit_kernels` on first use. The kernels
+are compiled on their first call and cached on disk, so later sessions skip the compilation.
+"""
+import numpy as np
+from numba import njit, prange
+
+# pylint: disable=not-an-iterable,comparison-with-itself
+# Numba idioms: prange is iterable once compiled, and `value == value` is the branch-free NaN check
+
+# Number of features processed together by each thread of welford_nan_rows, spanning a few cache lines of each row
+_FEATURE_BLOCK = 64
+
+
+@njit(parallel=True, cache=True)
+def welford_nan_columns(X):
+    """Column-parallel equivalent of `standard_scaler._welford_nan`, running Welford's online update over the rows of
+    each feature. NaNs are skipped element-wise without building a mask.
+    """
+    n_samples, n_features = X.shape
+    mean = np.zeros(n_features, dtype=X.dtype)
+    m2 = np.zeros(n_features, dtype=X.dtype)
+    count = np.zeros(n_features, dtype=np.int64)
+
+    for j in prange(n_features):
+        col_count = 0
+        col_mean = 0.0
+        col_m2 = 0.0
+
+        for i in range(n_samples):
+            value = X[i, j]
+
+            if not np.isnan(value):
+                col_count += 1
+                delta = value - col_mean
+                col_mean += delta / col_count
+                col_m2 += delta * (value - col_mean)
+
+        count[j] = col_count
+        mean[j] = col_mean if col_count > 0 else np.nan
+        m2[j] = col_m2 if col_count > 0 else np.nan
+
+    return mean, m2, count
+
+
+@njit(parallel=True, cache=True)
+def welford_nan_rows(X):
+    """Row-major equivalent of `welford_nan_columns`, for C-contiguous `X`. Each thread handles a block of features and
+    walks down the rows, so that the inner loop over features reads contiguous memory and can be vectorised, with NaNs
+    detected by the `value == value` self-comparison.
+    """
+    n_samples, n_features = X.shape
+    mean = np.zeros(n_features)
+    m2 = np.zeros(n_features)
+    count = np.zeros(n_features, dtype=np.int64)
+
+    for block in prange((n_features + _FEATURE_BLOCK - 1) // _FEATURE_BLOCK):
+        start = block * _FEATURE_BLOCK
+        stop = min(start + _FEATURE_BLOCK, n_features)
+
+        for i in range(n_samples):
+            for j in range(start, stop):
+                value = X[i, j]
+
+                if value == value:
+                    count[j] += 1
+                    delta = value - mean[j]
+                    mean[j] += delta / count[j]
+                    m2[j] += delta * (value - mean[j])
+
+    for j in range(n_features):
+        if count[j] == 0:
+            mean[j] = np.nan
+            m2[j] = np.nan
+
+    return mean.astype(X.dtype), m2.astype(X.dtype), count
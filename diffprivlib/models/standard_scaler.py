@@ -44,50 +44,151 @@
 Standard Scaler with differential privacy
 """
 import warnings
+from functools import lru_cache
 
 import numpy as np
 import sklearn.preprocessing as sk_pp
-try:
-    from sklearn.preprocessing._data import _handle_zeros_in_scale
-except ImportError:
-    from sklearn.preprocessing.data import _handle_zeros_in_scale
 from sklearn.utils import check_array
 from sklearn.utils.validation import FLOAT_DTYPES
 
 from diffprivlib.utils import PrivacyLeakWarning
-from diffprivlib.tools import nanvar, nanmean
+from diffprivlib.tools.utils import _check_ranges, _randomise_mean, _randomise_var
 
 range_ = range
 
+# Number of elements of X processed per block in _welford_nan, chosen so that each block stays resident in cache
+_BLOCK_ELEMENTS = 2 ** 16
 
-def _incremental_mean_and_var(X, epsilon, range, last_mean, last_variance, last_sample_count):
+
+def _welford_nan(X):
+    """Computes the per-feature mean, sum of squared deviations from the mean (M2) and count of `X`, ignoring NaNs.
+
+    `X` is traversed once, in blocks of rows, with the statistics of each block merged into the running totals using
+    Equation 2.1b of Chan, Golub and LeVeque (1983).
+    """
+    n_features = X.shape[1]
+    mean = np.zeros(n_features, dtype=X.dtype)
+    m2 = np.zeros(n_features, dtype=X.dtype)
+    count = np.zeros(n_features, dtype=np.int64)
+
+    block_size = max(1, _BLOCK_ELEMENTS // max(1, n_features))
+
+    for start in range_(0, X.shape[0], block_size):
+        block = X[start:start + block_size]
+        mask = np.isnan(block)
+        block_count = block.shape[0] - np.count_nonzero(mask, axis=0)
+
+        # The mask and its zero-filled copy of the block are reused for the deviations, rather than re-scanning
+        filled = np.where(mask, 0.0, block)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            block_mean = filled.sum(axis=0) / block_count
+
+        deviation = np.subtract(filled, block_mean, out=filled)
+        deviation[mask] = 0.0
+        block_m2 = np.einsum('ij,ij->j', deviation, deviation)
+
+        updated_count = count + block_count
+        ratio = np.divide(block_count, updated_count, out=np.zeros(n_features, dtype=X.dtype),
+                          where=updated_count > 0)
+        delta = np.where(block_count > 0, block_mean - mean, 0.0)
+
+        mean += delta * ratio
+        m2 += block_m2 + delta ** 2 * count.astype(X.dtype) * ratio
+        count = updated_count
+
+    mean[count == 0] = np.nan
+    m2[count == 0] = np.nan
+
+    return mean, m2, count
+
+
+@lru_cache(maxsize=None)
+def _jit_kernels():
+    """Imports the Numba kernels of `_numba_kernels` on first use, so that Numba is only loaded once NaN-aware moments
+    are needed. Returns `None` if Numba is not installed, in which case `_welford_nan` is used instead."""
+    try:
+        from diffprivlib.models import _numba_kernels
+    except ImportError:
+        return None
+
+    return _numba_kernels
+
+
+def _mean_and_var(X, epsilon, range, epsilon_var=None):
+    """Computes the differentially private mean of each feature of `X` with budget `epsilon`, and its variance with
+    budget `epsilon_var` (skipped if `None`), ignoring NaNs, together with the number of non-NaN samples of each
+    feature."""
+    # Column sums propagate NaNs, so they tell us whether the NaN-aware moments are needed at all
+    total = X.sum(axis=0)
+    has_nan = np.isnan(total).any()
+
+    # Numba has no float16 support, so other float dtypes accepted by check_array fall back to NumPy
+    kernels = _jit_kernels() if has_nan and X.dtype in (np.float32, np.float64) else None
+
+    if kernels is not None and X.flags['C_CONTIGUOUS'] and X.shape[1] > 1:
+        actual_mean, m2, sample_count = kernels.welford_nan_rows(X)
+    elif kernels is not None:
+        actual_mean, m2, sample_count = kernels.welford_nan_columns(X)
+    elif has_nan:
+        actual_mean, m2, sample_count = _welford_nan(X)
+    else:
+        actual_mean = total / X.shape[0]
+        m2 = None
+        sample_count = np.full(X.shape[1], X.shape[0], dtype=np.int64)
+
+    # The sensitivities of the mean and variance only depend on the range and the batch size, so are computed once
+    mean_sensitivity = _check_ranges(range, actual_mean, X, 0, "np.mean()") / X.shape[0]
+    dp_mean = _randomise_mean(actual_mean, mean_sensitivity, epsilon)
+
+    if epsilon_var is None:
+        return dp_mean, None, sample_count
+
+    actual_var = np.true_divide(m2, sample_count, dtype=X.dtype) if has_nan else X.var(axis=0)
+    var_sensitivity = mean_sensitivity ** 2 * (X.shape[0] - 1)
+    dp_var = _randomise_var(actual_var, var_sensitivity, epsilon_var)
+
+    return dp_mean, dp_var, sample_count
+
+
+def _incremental_mean_and_var(X, epsilon, range, last_mean, last_variance, last_sample_count, epsilon_var=None):
     # old = stats until now
     # new = the current increment
     # updated = the aggregated stats
-    last_sum = last_mean * last_sample_count
-    new_mean = nanmean(X, epsilon=epsilon, axis=0, range=range)
-    new_sample_count = np.sum(~np.isnan(X), axis=0)
-    new_sum = new_mean * new_sample_count
+    if last_variance is None:
+        epsilon_var = None
+    elif epsilon_var is None:
+        epsilon_var = epsilon
+
+    new_mean, new_variance, new_sample_count = _mean_and_var(X, epsilon, range, epsilon_var)
     updated_sample_count = last_sample_count + new_sample_count
 
-    updated_mean = (last_sum + new_sum) / updated_sample_count
+    # Equation 2.1b of Chan, Golub and LeVeque, normalised by updated_sample_count so that it is a weighted sum of the
+    # old and new statistics. The correction term vanishes when last_sample_count == 0. The freshly computed new_mean
+    # and new_variance are used as output buffers, so that `weight`, `last_weight` and `delta` are the only temporaries.
+    # The merge is computed in the common dtype of X and the old statistics, so that float32 inputs are not promoted to
+    # float64, but float64 statistics are not downcast by a float32 increment either.
+    dtype = np.result_type(X.dtype, last_mean)
+    new_mean = new_mean.astype(dtype, copy=False)
+    weight = np.true_divide(new_sample_count, updated_sample_count, dtype=dtype)
+    delta = np.subtract(new_mean, last_mean, dtype=dtype)
+
+    updated_mean = np.multiply(delta, weight, out=new_mean)
+    updated_mean += last_mean
 
     if last_variance is None:
         updated_variance = None
     else:
-        new_unnormalized_variance = nanvar(X, epsilon=epsilon, axis=0, range=range) * new_sample_count
-        last_unnormalized_variance = last_variance * last_sample_count
+        last_weight = np.true_divide(last_sample_count, updated_sample_count, dtype=dtype)
 
-        with np.errstate(divide='ignore', invalid='ignore'):
-            last_over_new_count = last_sample_count / new_sample_count
-            updated_unnormalized_variance = (
-                last_unnormalized_variance + new_unnormalized_variance +
-                last_over_new_count / updated_sample_count *
-                (last_sum / last_over_new_count - new_sum) ** 2)
+        new_variance = new_variance.astype(dtype, copy=False)
 
-        zeros = last_sample_count == 0
-        updated_unnormalized_variance[zeros] = new_unnormalized_variance[zeros]
-        updated_variance = updated_unnormalized_variance / updated_sample_count
+        updated_variance = np.multiply(new_variance, weight, out=new_variance)
+        np.multiply(delta, delta, out=delta)
+        delta *= weight
+        delta *= last_weight
+        updated_variance += delta
+        updated_variance += np.multiply(last_weight, last_variance, out=last_weight)
 
     return updated_mean, updated_variance, updated_sample_count
 
@@ -114,8 +215,10 @@ class StandardScaler(sk_pp.StandardScaler):
     ----------
     epsilon: float, optional, default 1.0
         The privacy budget to be allocated to learning the mean and variance of the training sample.  If
-        `with_std=True`,  the privacy budget is split evenly between mean and variance (the mean must be calculated even
-        when `with_mean=False`, as it is used in the calculation of the variance.
+        `with_std=False`, the whole budget is spent on the mean.  If `with_mean=True` and `with_std=True`, the privacy
+        budget is split evenly between mean and variance.  If only `with_std=True`, the mean must still be calculated,
+        as it is used when combining the variances of successive batches, so a tenth of the budget is spent on the mean
+        and the rest on the variance.
 
     range:  array_like or None, default None
         Range of each feature of the sample. Same shape as np.ptp(X, axis=0). If not specified, `range` will be
@@ -166,12 +269,44 @@ class StandardScaler(sk_pp.StandardScaler):
         self.epsilon = epsilon
         self.range = range
 
-    def partial_fit(self, X, y=None):
+    def fit(self, X, y=None):
+        """Compute the mean and std with differential privacy to be used for later scaling.
+
+        Unlike :meth:`partial_fit`, all of X is known to be the only batch, so the statistics are computed directly,
+        without merging them with those of previous batches.
+
+        Parameters
+        ----------
+        X : {array-like}, shape [n_samples, n_features]
+            The data used to compute the mean and standard deviation used for later scaling along the features axis.
+
+        y
+            Ignored
+        """
+        # Reset internal state before fitting
+        self._reset()
+
+        epsilon_mean, epsilon_var = self._split_epsilon()
+
+        X = self._check_X(X)
+
+        if not self.with_mean and not self.with_std:
+            self.mean_ = None
+            self.var_ = None
+            self.n_samples_seen_ = X.shape[0] - np.count_nonzero(np.isnan(X), axis=0)
+        else:
+            self.mean_, self.var_, self.n_samples_seen_ = _mean_and_var(X, epsilon_mean, self.range, epsilon_var)
+
+        self._finalise_fit()
+
+        return self
+
+    def partial_fit(self, X, y=None, *, check_input=True):
         """Online computation of mean and std with differential privacy on X for later scaling. All of X is processed as
         a single batch. This is intended for cases when `fit` is not feasible due to very large number of `n_samples` or
         because X is read from a continuous stream.
 
-        The algorithm for incremental mean and std is given in Equation 1.5a,b in Chan, Tony F., Gene H. Golub, and
+        The algorithm for incremental mean and std is given in Equation 2.1b in Chan, Tony F., Gene H. Golub, and
         Randall J. LeVeque. "Algorithms for computing the sample variance: Analysis and recommendations." The American
         Statistician 37.3 (1983): 242-247:
 
@@ -182,58 +317,83 @@ class StandardScaler(sk_pp.StandardScaler):
 
         y
             Ignored
-        """
 
-        epsilon_0 = self.epsilon if self.with_std is None else self.epsilon / 2
-
-        X = check_array(X, accept_sparse=False, copy=self.copy, estimator=self, dtype=FLOAT_DTYPES,
-                        force_all_finite='allow-nan')
+        check_input : boolean, default True
+            If False, `X` is not validated with :func:`sklearn.utils.check_array`, and must already be a 2-dimensional
+            NumPy array of floats with the same number of features as previous batches.  Intended for streaming callers
+            that own their batches; do not use this parameter unless you know what you are doing.
+        """
 
-        if self.range is None:
-            warnings.warn("Range parameter hasn't been specified, so falling back to determining range from the data.\n"
-                          "This will result in additional privacy leakage. To ensure differential privacy with no "
-                          "additional privacy loss, specify `range` for each valued returned by np.mean().",
-                          PrivacyLeakWarning)
+        epsilon_mean, epsilon_var = self._split_epsilon()
 
-            self.range = np.maximum(np.ptp(X, axis=0), 1e-5)
+        X = self._check_X(X, check_input)
 
         # Even in the case of `with_mean=False`, we update the mean anyway. This is needed for the incremental
         # computation of the var See incr_mean_variance_axis and _incremental_mean_variance_axis
 
-        # if n_samples_seen_ is an integer (i.e. no missing values), we need to transform it to a NumPy array of
-        # shape (n_features,) required by incr_mean_variance_axis and _incremental_variance_axis
-        if hasattr(self, 'n_samples_seen_') and isinstance(self.n_samples_seen_, (int, np.integer)):
-            self.n_samples_seen_ = np.repeat(self.n_samples_seen_, X.shape[1]).astype(np.int64)
-
-        if not hasattr(self, 'n_samples_seen_'):
-            self.n_samples_seen_ = np.zeros(X.shape[1], dtype=np.int64)
-
-        # First pass
+        # The fitted attributes are all set together, so checking `scale_` alone is enough to detect the first pass
         if not hasattr(self, 'scale_'):
+            self.n_samples_seen_ = np.zeros(X.shape[1], dtype=np.int64)
             self.mean_ = .0
-            if self.with_std:
-                self.var_ = .0
-            else:
-                self.var_ = None
+            self.var_ = .0 if self.with_std else None
+        elif isinstance(self.n_samples_seen_, (int, np.integer)):
+            # if n_samples_seen_ is an integer (i.e. no missing values), we need to transform it to a NumPy array of
+            # shape (n_features,) required by _incremental_mean_and_var
+            self.n_samples_seen_ = np.full(X.shape[1], self.n_samples_seen_, dtype=np.int64)
 
         if not self.with_mean and not self.with_std:
             self.mean_ = None
             self.var_ = None
-            self.n_samples_seen_ += X.shape[0] - np.isnan(X).sum(axis=0)
+            self.n_samples_seen_ += X.shape[0] - np.count_nonzero(np.isnan(X), axis=0)
         else:
-            self.mean_, self.var_, self.n_samples_seen_ = _incremental_mean_and_var(X, epsilon_0, self.range,
+            self.mean_, self.var_, self.n_samples_seen_ = _incremental_mean_and_var(X, epsilon_mean, self.range,
                                                                                     self.mean_, self.var_,
-                                                                                    self.n_samples_seen_)
+                                                                                    self.n_samples_seen_, epsilon_var)
+
+        self._finalise_fit()
+
+        return self
+
+    def _split_epsilon(self):
+        """Splits `epsilon` between the mean and the variance, returning `None` for the variance when it is not needed.
+        When only the variance is required, the mean is still needed to merge the variances of successive batches, but
+        is given a smaller share of the budget."""
+        if not self.with_std:
+            return self.epsilon, None
+
+        if not self.with_mean:
+            return self.epsilon / 10, self.epsilon * 9 / 10
+
+        return self.epsilon / 2, self.epsilon / 2
+
+    def _check_X(self, X, check_input=True):
+        # Fitting never modifies X (NaNs are only replaced in per-block buffers), so `copy` need only apply in transform
+        if check_input:
+            X = check_array(X, accept_sparse=False, copy=False, estimator=self, dtype=FLOAT_DTYPES,
+                            force_all_finite='allow-nan')
+
+        if self.range is None:
+            warnings.warn("Range parameter hasn't been specified, so falling back to determining range from the data.\n"
+                          "This will result in additional privacy leakage. To ensure differential privacy with no "
+                          "additional privacy loss, specify `range` for each valued returned by np.mean().",
+                          PrivacyLeakWarning)
 
+            self.range = np.maximum(np.ptp(X, axis=0), 1e-5)
+
+        return X
+
+    def _finalise_fit(self):
         # for backward-compatibility, reduce n_samples_seen_ to an integer
         # if the number of samples is the same for each feature (i.e. no
         # missing values)
-        if np.ptp(self.n_samples_seen_) == 0:
-            self.n_samples_seen_ = self.n_samples_seen_[0]
+        first = self.n_samples_seen_[0]
+        if self.n_samples_seen_[-1] == first and (self.n_samples_seen_ == first).all():
+            self.n_samples_seen_ = first
 
         if self.with_std:
-            self.scale_ = _handle_zeros_in_scale(np.sqrt(self.var_))
+            # Features with (near-)zero variance are left unscaled, using the same eps-based mask as sklearn's
+            # _handle_zeros_in_scale, so that rounding errors in the variance of a constant feature are not amplified
+            self.scale_ = np.sqrt(self.var_)
+            self.scale_[self.scale_ < 10 * np.finfo(self.scale_.dtype).eps] = 1.0
         else:
             self.scale_ = None
-
-        return self
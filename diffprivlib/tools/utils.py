@@ -188,6 +188,17 @@ def _mean(a, epsilon=1.0, range=None, axis=None, dtype=None, out=None, keepdims=
     else:
         actual_mean = np.mean(a, axis=axis, dtype=dtype, out=out, keepdims=keepdims)
 
+    ranges = _check_ranges(range, actual_mean, a, axis, "np.mean()")
+
+    if isinstance(actual_mean, np.ndarray):
+        return _randomise_mean(actual_mean, ranges / num_datapoints, epsilon)
+
+    return _randomise_mean(actual_mean, np.ravel(ranges)[0] / num_datapoints, epsilon)
+
+
+def _check_ranges(range, actual, a, axis, func_name):
+    """Resolves `range` to an array of the same shape as `actual`, falling back to the range of `a` along `axis` if not
+    specified."""
     if range is None:
         warnings.warn("Range parameter hasn't been specified, so falling back to determining range from the data.\n"
                       "This will result in additional privacy leakage. To ensure differential privacy with no "
@@ -196,29 +207,41 @@ def _mean(a, epsilon=1.0, range=None, axis=None, dtype=None, out=None, keepdims=
 
         ranges = np.maximum(np.ptp(a, axis=axis), 1e-5)
     elif isinstance(range, Real):
-        ranges = np.ones_like(actual_mean) * range
+        ranges = np.ones_like(actual) * range
     else:
         ranges = np.array(range)
 
     if not (ranges > 0).all():
-        raise ValueError("Ranges must be specified for each value returned by np.mean(), and must be non-negative")
-    if ranges.shape != actual_mean.shape:
-        raise ValueError("Shape of range must be same as shape of np.mean")
+        raise ValueError("Ranges must be specified for each value returned by %s, and must be non-negative" % func_name)
+    if ranges.shape != np.shape(actual):
+        raise ValueError("Shape of range must be same as shape of %s" % func_name)
 
-    if isinstance(actual_mean, np.ndarray):
-        dp_mean = np.zeros_like(actual_mean)
-        iterator = np.nditer(actual_mean, flags=['multi_index'])
+    return ranges
 
-        while not iterator.finished:
-            dp_mech = Laplace().set_epsilon(epsilon).set_sensitivity(ranges[iterator.multi_index] / num_datapoints)
 
-            dp_mean[iterator.multi_index] = dp_mech.randomise(float(iterator[0]))
-            iterator.iternext()
+def _laplace_noise(shape, sensitivity, epsilon, delta=0.0):
+    """Draws an array of Laplace noise of the given `shape` and (per-entry) `sensitivity`, with the same distribution
+    and sequence of random numbers as calling :meth:`.Laplace.randomise` on each entry in turn."""
+    Laplace().set_epsilon_delta(epsilon, delta)
+    sensitivity = np.asarray(sensitivity, dtype=float)
+
+    if not (sensitivity > 0).all():
+        raise ValueError("Sensitivity must be strictly positive")
+
+    scale = sensitivity / (epsilon - np.log(1 - delta))
+    unif_rv = np.random.random(shape) - 0.5
+
+    return - scale * np.sign(unif_rv) * np.log(1 - 2 * np.abs(unif_rv))
+
+
+def _randomise_mean(actual_mean, sensitivity, epsilon=1.0):
+    """Adds differentially private noise to a pre-computed mean, given its (per-entry) sensitivity."""
+    if isinstance(actual_mean, np.ndarray):
+        dp_mean = actual_mean + _laplace_noise(actual_mean.shape, sensitivity, epsilon)
 
-        return dp_mean
+        return dp_mean.astype(actual_mean.dtype, copy=False)
 
-    range = np.ravel(ranges)[0]
-    dp_mech = Laplace().set_epsilon(epsilon).set_sensitivity(range / num_datapoints)
+    dp_mech = Laplace().set_epsilon(epsilon).set_sensitivity(sensitivity)
 
     return dp_mech.randomise(actual_mean)
 
@@ -369,39 +392,31 @@ def _var(a, epsilon=1.0, range=None, axis=None, dtype=None, out=None, ddof=0, ke
     else:
         actual_var = np.var(a, axis=axis, dtype=dtype, out=out, ddof=ddof, keepdims=keepdims)
 
-    if range is None:
-        warnings.warn("Range parameter hasn't been specified, so falling back to determining range from the data.\n"
-                      "This will result in additional privacy leakage. To ensure differential privacy with no "
-                      "additional privacy loss, specify `range` for each valued returned by np.mean().",
-                      PrivacyLeakWarning)
+    ranges = _check_ranges(range, actual_var, a, axis, "np.var()")
 
-        ranges = np.maximum(np.ptp(a, axis=axis), 1e-5)
-    elif isinstance(range, Real):
-        ranges = np.ones_like(actual_var) * range
-    else:
-        ranges = np.array(range)
+    if isinstance(actual_var, np.ndarray):
+        return _randomise_var(actual_var, (ranges / num_datapoints) ** 2 * (num_datapoints - 1), epsilon)
+
+    return _randomise_var(actual_var, np.ravel(ranges)[0] ** 2 / num_datapoints, epsilon)
 
-    if not (ranges > 0).all():
-        raise ValueError("Ranges must be specified for each value returned by np.var(), and must be non-negative")
-    if ranges.shape != actual_var.shape:
-        raise ValueError("Shape of range must be same as shape of np.var()")
 
+def _randomise_var(actual_var, sensitivity, epsilon=1.0):
+    """Adds differentially private noise to a pre-computed variance, given its (per-entry) sensitivity."""
     if isinstance(actual_var, np.ndarray):
         dp_var = np.zeros_like(actual_var)
         iterator = np.nditer(actual_var, flags=['multi_index'])
 
         while not iterator.finished:
             dp_mech = LaplaceBoundedDomain().set_epsilon(epsilon).set_bounds(0, float("inf")) \
-                .set_sensitivity((ranges[iterator.multi_index] / num_datapoints) ** 2 * (num_datapoints - 1))
+                .set_sensitivity(sensitivity[iterator.multi_index])
 
             dp_var[iterator.multi_index] = dp_mech.randomise(float(iterator[0]))
             iterator.iternext()
 
         return dp_var
 
-    range = np.ravel(ranges)[0]
     dp_mech = LaplaceBoundedDomain().set_epsilon(epsilon).set_bounds(0, float("inf")). \
-        set_sensitivity(range ** 2 / num_datapoints)
+        set_sensitivity(sensitivity)
 
     return dp_mech.randomise(actual_var)
 
@@ -1,13 +1,80 @@
-from unittest import TestCase
+from unittest import TestCase, skipIf
+from unittest.mock import patch
 
 import numpy as np
 from sklearn.utils.extmath import _incremental_mean_and_var as sk_incremental_mean_and_var
 import sklearn.preprocessing as sk_pp
+from sklearn.utils import check_array
 
-from diffprivlib.models.standard_scaler import _incremental_mean_and_var, StandardScaler
+from diffprivlib.models.standard_scaler import _incremental_mean_and_var, _jit_kernels, _welford_nan, \
+    StandardScaler
 from diffprivlib.utils import PrivacyLeakWarning, global_seed
 
 
+class TestWelfordNan(TestCase):
+    def test_multiple_blocks(self):
+        X = np.random.rand(10000, 20)
+        X[np.random.rand(*X.shape) < 0.1] = np.nan
+
+        mean, m2, count = _welford_nan(X)
+
+        self.assertTrue(np.allclose(mean, np.nanmean(X, axis=0)))
+        self.assertTrue(np.allclose(m2 / count, np.nanvar(X, axis=0)))
+        self.assertTrue((count == np.sum(~np.isnan(X), axis=0)).all())
+
+    @skipIf(_jit_kernels() is None, "Numba is not installed")
+    def test_jit_matches_numpy(self):
+        X = np.random.rand(1000, 20)
+        X[np.random.rand(*X.shape) < 0.1] = np.nan
+
+        mean, m2, count = _welford_nan(X)
+        jit_mean, jit_m2, jit_count = _jit_kernels().welford_nan_columns(X)
+
+        self.assertTrue(np.allclose(mean, jit_mean))
+        self.assertTrue(np.allclose(m2, jit_m2))
+        self.assertTrue((count == jit_count).all())
+
+    @skipIf(_jit_kernels() is None, "Numba is not installed")
+    def test_rows_jit_matches_numpy(self):
+        X = np.random.rand(1000, 150)
+        X[np.random.rand(*X.shape) < 0.1] = np.nan
+        X[:, 70] = np.nan
+
+        mean, m2, count = _welford_nan(X)
+        jit_mean, jit_m2, jit_count = _jit_kernels().welford_nan_rows(X)
+
+        self.assertTrue(np.allclose(mean, jit_mean, equal_nan=True))
+        self.assertTrue(np.allclose(m2, jit_m2, equal_nan=True))
+        self.assertTrue((count == jit_count).all())
+
+    @skipIf(_jit_kernels() is None, "Numba is not installed")
+    def test_c_order_uses_rows_jit(self):
+        X = np.random.rand(10000, 10)
+        X[np.random.rand(*X.shape) < 0.1] = np.nan
+        kernels = _jit_kernels()
+
+        with patch.object(kernels, "welford_nan_rows", wraps=kernels.welford_nan_rows) as rows, \
+                patch.object(kernels, "welford_nan_columns", wraps=kernels.welford_nan_columns) as columns:
+            StandardScaler(epsilon=float("inf"), range=1).fit(X)
+            self.assertEqual(rows.call_count, 1)
+            self.assertEqual(columns.call_count, 0)
+
+            StandardScaler(epsilon=float("inf"), range=1).fit(np.asfortranarray(X))
+            self.assertEqual(rows.call_count, 1)
+            self.assertEqual(columns.call_count, 1)
+
+    @skipIf(_jit_kernels() is None, "Numba is not installed")
+    def test_float16_falls_back_to_numpy(self):
+        X = np.random.rand(100, 5)
+        X[np.random.rand(*X.shape) < 0.1] = np.nan
+
+        for X16 in (X.astype(np.float16), np.asfortranarray(X, dtype=np.float16)):
+            dp_ss = StandardScaler(range=1, epsilon=float("inf")).fit(X16)
+
+            self.assertTrue(np.allclose(dp_ss.mean_, np.nanmean(X16, axis=0, dtype=np.float64), atol=1e-2))
+            self.assertTrue(np.allclose(dp_ss.var_, np.nanvar(X16, axis=0, dtype=np.float64), atol=1e-2))
+
+
 class TestIncrementalMeanAndVar(TestCase):
     def test_no_range(self):
         X = np.random.rand(5, 10)
@@ -38,6 +105,19 @@ class TestIncrementalMeanAndVar(TestCase):
         self.assertTrue(np.allclose(dp_var, sk_var))
         self.assertTrue((dp_count == sk_count).all())
 
+    def test_nan_inf_epsilon(self):
+        X = np.random.rand(10, 5)
+        X[[0, 3, 4], [1, 1, 3]] = np.nan
+        dp_mean, dp_var, dp_count = _incremental_mean_and_var(X, epsilon=float("inf"), range=1, last_mean=0.,
+                                                              last_variance=0.,
+                                                              last_sample_count=np.zeros(X.shape[1], dtype=np.int64))
+        sk_mean, sk_var, sk_count = sk_incremental_mean_and_var(X, last_mean=0., last_variance=0.,
+                                                                last_sample_count=np.zeros(X.shape[1], dtype=np.int64))
+
+        self.assertTrue(np.allclose(dp_mean, sk_mean))
+        self.assertTrue(np.allclose(dp_var, sk_var))
+        self.assertTrue((dp_count == sk_count).all())
+
     def test_increment_inf_epsilon(self):
         X = np.ones((5, 1))
         dp_mean, dp_var, dp_count = _incremental_mean_and_var(X, epsilon=float("inf"), range=1, last_mean=0.,
@@ -58,6 +138,17 @@ class TestIncrementalMeanAndVar(TestCase):
         self.assertTrue(np.all(count1 == 10), "Counts should be 10, got %s" % count1)
         self.assertTrue(np.all(count2 == 20), "Counts should be 20, got %s" % count2)
 
+    def test_two_batches_inf_epsilon(self):
+        X = np.random.rand(30, 5)
+        mean1, var1, count1 = _incremental_mean_and_var(X[:10], epsilon=float("inf"), range=1, last_mean=0.,
+                                                        last_variance=0., last_sample_count=0)
+        mean2, var2, count2 = _incremental_mean_and_var(X[10:], epsilon=float("inf"), range=1, last_mean=mean1,
+                                                        last_variance=var1, last_sample_count=count1)
+
+        self.assertTrue(np.allclose(mean2, X.mean(axis=0)))
+        self.assertTrue(np.allclose(var2, X.var(axis=0)))
+        self.assertTrue(np.all(count2 == 30), "Counts should be 30, got %s" % count2)
+
     def test_different_results(self):
         X = np.random.rand(10, 5)
         mean1, var1, count1 = _incremental_mean_and_var(X, epsilon=1, range=1, last_mean=0., last_variance=0.,
@@ -142,3 +233,135 @@ class TestStandardScaler(TestCase):
         self.assertTrue(np.allclose(dp_ss.var_, sk_ss.var_, rtol=1, atol=1e-4), "Arrays %s and %s should be close" %
                         (dp_ss.var_, sk_ss.var_))
         self.assertTrue(np.all(dp_ss.n_samples_seen_ == sk_ss.n_samples_seen_))
+
+    def test_no_mean_no_std(self):
+        X = np.random.rand(10, 5)
+        X[[0, 3, 4], [1, 1, 3]] = np.nan
+
+        dp_ss = StandardScaler(range=1, with_mean=False, with_std=False)
+        dp_ss.fit(X)
+
+        sk_ss = sk_pp.StandardScaler(with_mean=False, with_std=False)
+        sk_ss.fit(X)
+
+        self.assertIsNone(dp_ss.mean_)
+        self.assertIsNone(dp_ss.scale_)
+        self.assertTrue(np.all(dp_ss.n_samples_seen_ == sk_ss.n_samples_seen_))
+
+    def test_partial_fit_inf_epsilon(self):
+        X = np.random.rand(30, 5)
+        X[[0, 12, 25], [1, 1, 3]] = np.nan
+
+        dp_ss = StandardScaler(range=1, epsilon=float("inf"))
+        sk_ss = sk_pp.StandardScaler()
+
+        for batch in (X[:10], X[10:20], X[20:]):
+            dp_ss.partial_fit(batch)
+            sk_ss.partial_fit(batch)
+
+        self.assertTrue(np.allclose(dp_ss.mean_, sk_ss.mean_))
+        self.assertTrue(np.allclose(dp_ss.var_, sk_ss.var_))
+        self.assertTrue(np.all(dp_ss.n_samples_seen_ == sk_ss.n_samples_seen_))
+
+        dp_ss.fit(X[:10])
+        self.assertTrue(np.all(dp_ss.n_samples_seen_ == 10 - np.isnan(X[:10]).sum(axis=0)))
+
+    def test_constant_feature(self):
+        X = np.random.rand(10, 5)
+        X[:, 2] = 0.1
+
+        dp_ss = StandardScaler(range=1, epsilon=float("inf"))
+        dp_ss.fit(X)
+        sk_ss = sk_pp.StandardScaler().fit(X)
+
+        # The variance of a constant 0.1 is not computed as exactly zero, but must still leave the feature unscaled
+        self.assertAlmostEqual(dp_ss.var_[2], 0)
+        self.assertEqual(dp_ss.scale_[2], 1)
+        self.assertTrue(np.allclose(dp_ss.scale_[[0, 1, 3, 4]], sk_ss.scale_[[0, 1, 3, 4]]))
+        self.assertTrue(np.allclose(dp_ss.transform(X)[:, 2], 0))
+
+    def test_float32(self):
+        X = np.random.rand(30, 5)
+        X[[0, 12, 25], [1, 1, 3]] = np.nan
+
+        dp_ss = StandardScaler(range=1, epsilon=float("inf"))
+        dp_ss.partial_fit(X[:15].astype(np.float32))
+        dp_ss.partial_fit(X[15:].astype(np.float32))
+
+        self.assertEqual(dp_ss.mean_.dtype, np.float32)
+        self.assertEqual(dp_ss.var_.dtype, np.float32)
+        self.assertTrue(np.allclose(dp_ss.mean_, np.nanmean(X, axis=0), atol=1e-5))
+        self.assertTrue(np.allclose(dp_ss.var_, np.nanvar(X, axis=0), atol=1e-5))
+
+    def test_float32_after_float64(self):
+        X = np.random.rand(100, 3)
+
+        dp_ss = StandardScaler(range=1, epsilon=float("inf"))
+        dp_ss.partial_fit(X[:50])
+        dp_ss.partial_fit(X[50:].astype(np.float32))
+
+        self.assertEqual(dp_ss.mean_.dtype, np.float64)
+        self.assertEqual(dp_ss.var_.dtype, np.float64)
+        self.assertTrue(np.allclose(dp_ss.mean_, X.mean(axis=0)))
+        self.assertTrue(np.allclose(dp_ss.var_, X.var(axis=0)))
+
+    def test_split_epsilon(self):
+        self.assertEqual(StandardScaler(epsilon=2)._split_epsilon(), (1, 1))
+        self.assertEqual(StandardScaler(epsilon=2, with_std=False)._split_epsilon(), (2, None))
+        self.assertEqual(StandardScaler(epsilon=2, with_mean=False)._split_epsilon(), (0.2, 1.8))
+
+    def test_with_std_only(self):
+        X = np.random.rand(10, 5)
+
+        dp_ss = StandardScaler(range=1, epsilon=float("inf"), with_mean=False)
+        dp_ss.fit(X)
+
+        sk_ss = sk_pp.StandardScaler(with_mean=False)
+        sk_ss.fit(X)
+
+        self.assertTrue(np.allclose(dp_ss.var_, sk_ss.var_))
+        self.assertTrue(np.allclose(dp_ss.scale_, sk_ss.scale_))
+        self.assertIsNotNone(dp_ss.transform(X))
+
+    def test_no_check_input(self):
+        X = np.random.rand(30, 5)
+
+        ss1 = StandardScaler(range=1, epsilon=float("inf"))
+        ss2 = StandardScaler(range=1, epsilon=float("inf"))
+
+        for batch in (X[:10], X[10:20], X[20:]):
+            ss1.partial_fit(batch)
+            ss2.partial_fit(batch, check_input=False)
+
+        self.assertTrue(np.allclose(ss1.mean_, ss2.mean_))
+        self.assertTrue(np.allclose(ss1.var_, ss2.var_))
+        self.assertEqual(ss1.n_samples_seen_, ss2.n_samples_seen_)
+
+    def test_no_check_input_skips_check_array(self):
+        X = np.random.rand(30, 5)
+        dp_ss = StandardScaler(range=1, epsilon=float("inf"))
+
+        with patch("diffprivlib.models.standard_scaler.check_array", wraps=check_array) as mock_check_array:
+            dp_ss.partial_fit(X[:10], check_input=False)
+            mock_check_array.assert_not_called()
+
+            dp_ss.partial_fit(X[10:])
+            mock_check_array.assert_called_once()
+
+        with self.assertRaises(TypeError):
+            dp_ss.partial_fit(X[20:], None, False)
+
+    def test_fit_leaves_X_unchanged(self):
+        X = np.random.rand(30, 5)
+        X[[0, 12, 25], [1, 1, 3]] = np.nan
+        X_orig = X.copy()
+
+        with patch("diffprivlib.models.standard_scaler.check_array", wraps=check_array) as mock_check_array:
+            StandardScaler(range=1).fit(X)
+            StandardScaler(range=1).partial_fit(X)
+
+        self.assertEqual(mock_check_array.call_count, 2)
+        for call in mock_check_array.call_args_list:
+            self.assertFalse(call[1]["copy"])
+
+        self.assertTrue(np.allclose(X, X_orig, rtol=0, atol=0, equal_nan=True))
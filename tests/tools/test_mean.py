@@ -3,7 +3,8 @@ from unittest import TestCase
 import numpy as np
 
 from diffprivlib.tools.utils import mean
-from diffprivlib.utils import PrivacyLeakWarning
+from diffprivlib.mechanisms import Laplace
+from diffprivlib.utils import PrivacyLeakWarning, global_seed
 
 
 class TestMean(TestCase):
@@ -53,6 +54,20 @@ class TestMean(TestCase):
         for i in range(res.shape[0]):
             self.assertAlmostEqual(res[i], res_dp[i], delta=0.01)
 
+    def test_axis_matches_mechanism(self):
+        a = np.random.random((1000, 5))
+        res = np.mean(a, axis=0)
+        ranges = np.array([1, 2, 3, 4, 5])
+
+        global_seed(314159)
+        res_dp = mean(a, epsilon=1, range=ranges, axis=0)
+
+        global_seed(314159)
+        mech = Laplace().set_epsilon(1)
+        expected = [mech.set_sensitivity(ranges[i] / 1000).randomise(res[i]) for i in range(res.shape[0])]
+
+        self.assertTrue(np.allclose(res_dp, expected))
+
     def test_nan(self):
         a = np.random.random((5, 5))
         a[2, 2] = np.nan